@@ -2,42 +2,108 @@ from __future__ import division, print_function
 
 import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 import sys
-import matplotlib.cm as cm
-import matplotlib.colors as colors 
 import matplotlib as mpl
 
-from matplotlib.ticker import MaxNLocator, FuncFormatter
+from matplotlib.ticker import MaxNLocator, FuncFormatter, FixedLocator, FixedFormatter
+
+try:
+    from fast_histogram import histogram2d as fh2d
+except ImportError:
+    fh2d = None
 
 __all__ = ["corner_plot","multi_corner_plot"]
 
-def confidence_2d(xsamples,ysamples,ax=None,weights=None,intervals=None,nbins=20,linecolor='k', cmap="Blues",filled=False,linewidth=1., gradient=False, scatter=False, scatter_size=2.,scatter_color='k', scatter_alpha=0.5 ):
+_mpl_version = tuple(int(n) for n in mpl.__version__.split('.')[:2])
+
+#ContourPy's "serial" algorithm is about twice as fast as the default, but it can 
+#only be selected from matplotlib 3.6 onwards
+if _mpl_version >= (3,6):
+    _contour_kwargs = {'algorithm':'serial'}
+else:
+    _contour_kwargs = {}
+
+def _rasterize_contours(cs):
+    """Rasterize a filled ContourSet. It is a single Collection from matplotlib 3.8, 
+        before that it holds one Collection per level."""
+    for artist in ([cs] if _mpl_version >= (3,8) else cs.collections):
+        artist.set_rasterized(True)
+
+def _level_indices(h,intervals):
+    """For h sorted in descending order, the index of the last bin whose cumulative 
+        fraction of the total is within each of the intervals (-1 if there is none)."""
+    cdf = np.cumsum(h)
+    cdf /= cdf[-1]
+    return np.searchsorted(cdf,intervals,side='right') - 1
+
+def histogram_2d(xsamples,ysamples,nbins=20,weights=None):
+    """Bin a 2d sample of points onto a uniform nbins x nbins grid spanning the 
+        data. Uses fast_histogram when it is available, which avoids the bin search 
+        that np.histogram2d does. Returns (H, xedges, yedges), with H indexed as [y,x]."""
+
+    if fh2d is None:
+        H,yedges,xedges = np.histogram2d(ysamples,xsamples,bins=nbins,weights=weights)
+        return H,xedges,yedges
+    xmin,xmax = np.min(xsamples),np.max(xsamples)
+    ymin,ymax = np.min(ysamples),np.max(ysamples)
+    #same convention as np.histogram2d for a degenerate range
+    if xmin == xmax:
+        xmin,xmax = xmin-0.5,xmax+0.5
+    if ymin == ymax:
+        ymin,ymax = ymin-0.5,ymax+0.5
+    #fast_histogram excludes the upper edge, so nudge it to keep the largest sample
+    H = fh2d(ysamples,xsamples,range=[[ymin,np.nextafter(ymax,np.inf)],[xmin,np.nextafter(xmax,np.inf)]],bins=nbins,weights=weights)
+    return H, np.linspace(xmin,xmax,nbins+1), np.linspace(ymin,ymax,nbins+1)
+
+def histograms_2d(traces,pairs,nbins=20,weights=None):
+    """Histogram each (x_var, y_var) pair of traces with histogram_2d. The pairs are 
+        independent, so with fast_histogram (which releases the GIL) they are binned in 
+        parallel threads. Returns a dict of (H, xedges, yedges) keyed by pair."""
+    pairs = list(pairs)
+    hist = lambda pair: histogram_2d(traces[pair[0]],traces[pair[1]],nbins=nbins,weights=weights)
+    if fh2d is None:
+        #np.histogram2d mostly holds the GIL, so threads would only add overhead
+        return {pair: hist(pair) for pair in pairs}
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        return dict(zip(pairs,pool.map(hist,pairs)))
+
+def confidence_2d(xsamples,ysamples,ax=None,weights=None,intervals=None,nbins=20,linecolor='k', cmap="Blues",filled=False,linewidth=1., gradient=False, scatter=False, scatter_size=2.,scatter_color='k', scatter_alpha=0.5, H=None, xedges=None, yedges=None, fast_fill=False ):
     """Draw confidence intervals at the levels asked from a 2d sample of points (e.g. 
-        output of MCMC)"""
+        output of MCMC). If the histogram H of the samples (and its edges) from histogram_2d 
+        is passed it is used as is, otherwise it is computed here. Returns the bin edges 
+        (xedges, yedges) of the histogram used (just the extent of the samples when scatter 
+        is True, as no histogram is needed then). If fast_fill is True, the filled regions are 
+        drawn as a single pcolormesh of the histogram bins instead of with contourf."""
 
     if intervals is None:
         intervals  = 1.0 - np.exp(-0.5 * np.array([0., 1., 2.]) ** 2)
-    H,yedges,xedges = np.histogram2d(ysamples,xsamples,bins=nbins,weights=weights)
+    if scatter:
+        #no histogram is needed, only the extent of the samples
+        if xedges is None:
+            xedges = np.array([np.min(xsamples),np.max(xsamples)])
+            yedges = np.array([np.min(ysamples),np.max(ysamples)])
+    elif H is None:
+        H,xedges,yedges = histogram_2d(xsamples,ysamples,nbins=nbins,weights=weights)
 
     #get the contour levels
     if not scatter:
         try:
-            h = np.sort(H.flatten())[::-1]
-            cdf = np.cumsum(h)/np.cumsum(h)[-1]
-            v = np.array([h[ cdf<=li ][-1] for li in intervals[1:]])[::-1]
-            v = np.append(v,h[0])
+            h = np.sort(H,axis=None)[::-1]
+            idx = _level_indices(h,np.asarray(intervals[1:],dtype=float))
+            if np.any(idx<0):
+                raise RuntimeError()
+            v = np.append(h[idx][::-1],h[0])
             if not np.all(np.diff(v)>0.):
                 raise RuntimeError() 
         except:
-            cNorm = colors.Normalize(vmin=0.,vmax=1.)
-            scalarMap = cm.ScalarMappable(norm=cNorm,cmap=cmap)
-            cVal = scalarMap.to_rgba(0.65)
+            cVal = plt.get_cmap(cmap)(0.65)
             ax.plot(xsamples,ysamples,'o',mec='none',mfc=cVal,alpha=scatter_alpha,ms=scatter_size, rasterized=True)
             ax.set_xlim((np.min(xedges),np.max(xedges)))
             ax.set_ylim((np.min(yedges),np.max(yedges)))
-            return None
+            return xedges,yedges
 
 
     else:
@@ -47,23 +113,34 @@ def confidence_2d(xsamples,ysamples,ax=None,weights=None,intervals=None,nbins=20
         ax.plot(xsamples,ysamples,'o',mec='none',mfc=scatter_color,alpha=scatter_alpha,ms=scatter_size, rasterized=True)
         ax.set_xlim((np.min(xedges),np.max(xedges)))
         ax.set_ylim((np.min(yedges),np.max(yedges)))
-        return None
-
-    xc = np.array([.5*(xedges[i]+xedges[i+1]) for i in np.arange(nbins)]) #bin centres
-    yc = np.array([.5*(yedges[i]+yedges[i+1]) for i in np.arange(nbins)])
+        return xedges,yedges
 
-    xx,yy = np.meshgrid(xc,yc)
+    xc = 0.5*(xedges[:-1]+xedges[1:]) #bin centres
+    yc = 0.5*(yedges[:-1]+yedges[1:])
 
     if filled:
         if gradient:
-            ax.imshow(H,cmap=cmap,origin='lower',extent=(np.min(xedges),np.max(xedges),np.min(yedges), np.max(yedges)),interpolation='bicubic',aspect='auto')
+            ax.imshow(H,cmap=cmap,origin='lower',extent=(np.min(xedges),np.max(xedges),np.min(yedges), np.max(yedges)),interpolation='bicubic',aspect='auto',rasterized=True)
+        elif fast_fill:
+            #colour each bin by the middle of the band it falls in, as contourf would
+            band = np.clip(np.searchsorted(v,H)-1,0,len(v)-2)
+            C = np.ma.masked_where(H<v[0],0.5*(v[:-1]+v[1:])[band])
+            ax.pcolormesh(xedges,yedges,C,cmap=cmap,vmin=v[0],vmax=v[-1],shading='flat',rasterized=True)
         else:
-            ax.contourf(xx,yy,H,levels=v,cmap=cmap)
-        ax.contour(xx,yy,H,levels=v,colors=linecolor,extend='max',linewidths=linewidth)
+            cs = ax.contourf(xc,yc,H,levels=v,cmap=cmap,**_contour_kwargs)
+            _rasterize_contours(cs)
+        ax.contour(xc,yc,H,levels=v,colors=linecolor,extend='max',linewidths=linewidth,**_contour_kwargs)
     else:
-        ax.contour(xx,yy,H,levels=v,colors=linecolor,linewidths=linewidth)        
+        ax.contour(xc,yc,H,levels=v,colors=linecolor,linewidths=linewidth,**_contour_kwargs)
 
-    return None
+    return xedges,yedges
+
+def histogram_steps(vals,walls):
+    """Turn the output of np.histogram into the (x, y) coordinates of a stepped
+        line that traces the top of the bars."""
+    xplot = np.concatenate(([walls[0]],np.repeat(walls,2)[:-1]))
+    yplot = np.concatenate((vals[:1],vals[:1],np.repeat(vals,2)))
+    return xplot,yplot
 
 def my_formatter(x, pos):
     """Format 1 as 1, 0 as 0, and all values whose absolute values is between
@@ -75,12 +152,32 @@ def my_formatter(x, pos):
     else:
         return val_str
 
+def _savefig_dpi(fname):
+    """The dpi to save fname at. Vector formats get 150 dpi for the rasterized fills, 
+        unless the user has set savefig.dpi themselves; anything else follows rcParams."""
+    if fname.split('.')[-1].lower() in ('pdf','svg','eps','ps') and mpl.rcParams['savefig.dpi'] == 'figure':
+        return 150
+    return None
+
+def freeze_ticks(fig,formatter):
+    """Fix the ticks of every visible axis in fig that uses formatter at their current 
+        locations, and format their labels once, so that they are not recomputed 
+        every time the figure is drawn. Only meant for figures that are about to be 
+        saved, as the ticks no longer follow changes to the axis limits."""
+    for ax in fig.axes:
+        for axis in (ax.xaxis,ax.yaxis):
+            if axis.get_visible() and axis.get_major_formatter() is formatter:
+                locs = axis.get_majorticklocs()
+                axis.set_major_locator(FixedLocator(locs))
+                axis.set_major_formatter(FixedFormatter([formatter(loc,None) for loc in locs]))
+
 def chain_results(chain):
     """Get the results from a chain using the 16th, 50th and 84th percentiles. 
     For each parameter a tuple is returned (best_fit, +err, -err)"""
-    return np.array(map(lambda v: [v[1],v[2]-v[1],v[1]-v[0]], zip(*np.percentile(chain,[16,50,84],axis=0))))
+    p = np.percentile(chain,[16,50,84],axis=0)
+    return np.stack([p[1],p[2]-p[1],p[1]-p[0]],axis=1)
 
-def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fname = None, nbins=40, figsize = (7.,7.), filled=True, gradient=False, cmap="Blues", truths = None, fontsize=20 , tickfontsize=15, nticks=4, linewidth=1., truthlinewidth=2., linecolor = 'k', markercolor = 'k', markersize = 10, wspace=0.5, hspace=0.5, scatter=False, scatter_size=2., scatter_color='k', scatter_alpha=0.5):
+def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fname = None, nbins=40, figsize = (7.,7.), filled=True, gradient=False, cmap="Blues", truths = None, fontsize=20 , tickfontsize=15, nticks=4, linewidth=1., truthlinewidth=2., linecolor = 'k', markercolor = 'k', markersize = 10, wspace=0.5, hspace=0.5, scatter=False, scatter_size=2., scatter_color='k', scatter_alpha=0.5, fast_fill=False):
 
     """
     Make a corner plot from MCMC output.
@@ -106,6 +203,9 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
     gradient: bool
         If True, then instead of filled contours, bicubic interpolation is applied to the 2D histograms (appropriate 
             when your posterior is densely sampled).
+    fast_fill: bool
+        If True, the filled contours are drawn bin by bin with a single pcolormesh rather than with contourf. 
+            This is much quicker to draw and save, at the cost of blocky edges.
     cmap : str
         Name of the colormap to use.
     truths : array_like[ndim]
@@ -146,9 +246,11 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
         print_values = False #current method for extracting results won't work for that
 
     if print_values is True:
-        res = chain_results(chain)
+        med, hi, lo = np.percentile(chain,[50,84,16],axis=0)
+        eplus, eminus = hi - med, med - lo
         
-    traces = chain.T
+    #one contiguous row per parameter, so the histograms stream through memory
+    traces = np.ascontiguousarray(np.transpose(chain))
 
     if axis_labels is None:
         axis_labels = ['']*len(traces)
@@ -159,7 +261,6 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
     if truths != None and ( len(truths) != len(traces) ):
         print("There must be the same number of true values as traces",file=sys.stderr)
 
-    num_samples = min([ len(trace) for trace in traces])
     n_traces = len(traces)
 
     #Set up the figure
@@ -196,10 +297,8 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
     #Remove the ticks from the axes which don't need them
     for x_var in range( n_traces -1 ):
         for y_var in range( 1, n_traces - 1):
-            try:
+            if (x_var,y_var) in hist_2d_axes:
                 hist_2d_axes[(x_var,y_var)].xaxis.set_visible(False)
-            except KeyError:
-                continue
     for var in range( n_traces - 1 ):
         hist_1d_axes[var].set_xticklabels([])
         hist_1d_axes[var].xaxis.set_major_locator(MaxNLocator(nticks))
@@ -207,112 +306,79 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
 
     for y_var in range( 1, n_traces ):
         for x_var in range( 1, n_traces - 1):
-            try:
+            if (x_var,y_var) in hist_2d_axes:
                 hist_2d_axes[(x_var,y_var)].yaxis.set_visible(False)
-            except KeyError:
-                continue
 
     #Do the plotting
     #Firstly make the 1D histograms
-    vals, walls = np.histogram(traces[-1][:num_samples], bins=nbins, weights=weights, normed = True)
-
-    xplot = np.zeros( nbins*2 + 2 )
-    yplot = np.zeros( nbins*2 + 2 )
-    for i in range(1, nbins * 2 + 1 ):
-        xplot[i] = walls[int((i-1)/2)]
-        yplot[i] = vals[int((i-2)/2)]
-
-    xplot[0] = walls[0]
-    xplot[-1] = walls[-1]
-    yplot[0] = yplot[1]
-    yplot[-1] = yplot[-2]
+    hists_1d = [ np.histogram(trace, bins=nbins, weights=weights, density=True) for trace in traces ]
 
     if not scatter:
-        Cmap = colors.Colormap(cmap)
-        cNorm = colors.Normalize(vmin=0.,vmax=1.)
-        scalarMap = cm.ScalarMappable(norm=cNorm,cmap=cmap)
-        cVal = scalarMap.to_rgba(0.65)
+        cVal = plt.get_cmap(cmap)(0.65)
     else:
         cVal = scatter_color
+    bgVal = plt.get_cmap(cmap)(0.)
+    #style of the truth markers, shared by every 2D panel
+    truth_marker = dict(marker='*', linestyle='none', color=markercolor, markersize=markersize, markeredgecolor='none')
 
-    #this one's special, so do it on it's own
-    if print_values is True:
-        hist_1d_axes[n_traces - 1].set_title("${0:.2f}^{{ +{1:.2f} }}_{{ -{2:.2f} }}$".format(res[n_traces - 1][0],res[n_traces - 1][1],res[n_traces - 1][2]),fontsize=fontsize)    
-    hist_1d_axes[n_traces - 1].plot(xplot, yplot, color = linecolor, lw=linewidth)
-    if filled: hist_1d_axes[n_traces - 1].fill_between(xplot,yplot,color=cVal)
-    hist_1d_axes[n_traces - 1].set_xlim( walls[0], walls[-1] )
+    for x_var in range( n_traces ):
+        vals, walls = hists_1d[x_var]
+
+        xplot, yplot = histogram_steps(vals,walls)
+
+        if print_values is True:
+            hist_1d_axes[x_var].set_title("${0:.2f}^{{ +{1:.2f} }}_{{ -{2:.2f} }}$".format(med[x_var],eplus[x_var],eminus[x_var]),fontsize=fontsize)  
+        hist_1d_axes[x_var].plot(xplot, yplot, color = linecolor , lw=linewidth)
+        if filled: hist_1d_axes[x_var].fill_between(xplot,yplot,color=cVal)
+        hist_1d_axes[x_var].set_xlim( walls[0], walls[-1] )
+        if truths is not None:
+            xlo,xhi = hist_1d_axes[x_var].get_xlim()
+            if truths[x_var]<xlo:
+                dx = xlo-truths[x_var]
+                hist_1d_axes[x_var].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
+            elif truths[x_var]>xhi:
+                dx = truths[x_var]-xhi
+                hist_1d_axes[x_var].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
+            hist_1d_axes[x_var].axvline(truths[x_var],ls='--',c='k',lw=truthlinewidth)
+
+    #the last one is special, as it also gets the x axis label
     hist_1d_axes[n_traces - 1].set_xlabel(axis_labels[-1],fontsize=fontsize)
     hist_1d_axes[n_traces - 1].tick_params(labelsize=tickfontsize)
     hist_1d_axes[n_traces - 1].xaxis.set_major_locator(MaxNLocator(nticks))
     hist_1d_axes[n_traces - 1].yaxis.set_visible(False)
     plt.setp(hist_1d_axes[n_traces - 1].xaxis.get_majorticklabels(), rotation=45)
-    if truths is not None:
-        xlo,xhi = hist_1d_axes[n_traces-1].get_xlim()
-        if truths[n_traces-1]<xlo:
-            dx = xlo-truths[n_traces-1]
-            hist_1d_axes[n_traces-1].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
-        elif truths[n_traces-1]>xhi:
-            dx = truths[n_traces-1]-xhi
-            hist_1d_axes[n_traces-1].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
-        hist_1d_axes[n_traces - 1].axvline(truths[n_traces - 1],ls='--',c='k',lw=truthlinewidth)
 
 
     #Now Make the 2D histograms
-    for x_var in range( n_traces ):
-        for y_var in range( n_traces):
-            try:
-                H, y_edges, x_edges = np.histogram2d( traces[y_var][:num_samples], traces[x_var][:num_samples], weights=weights, bins = nbins )
-                confidence_2d(traces[x_var][:num_samples],traces[y_var][:num_samples],weights=weights, ax=hist_2d_axes[(x_var,y_var)],nbins=nbins,intervals=None,linecolor=linecolor,filled=filled,cmap=cmap,linewidth=linewidth, gradient=gradient,scatter=scatter, scatter_color=scatter_color, scatter_alpha=scatter_alpha, scatter_size=scatter_size)
-                hist_2d_axes[(x_var,y_var)].set_xlim( x_edges[0], x_edges[-1] )
-                hist_2d_axes[(x_var,y_var)].set_ylim( y_edges[0], y_edges[-1] )
-                if truths is not None:
-                    xlo,xhi = hist_2d_axes[(x_var,y_var)].get_xlim()
-                    ylo,yhi = hist_2d_axes[(x_var,y_var)].get_ylim()
-                    if truths[x_var]<xlo:
-                        dx = xlo-truths[x_var]
-                        hist_2d_axes[(x_var,y_var)].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
-                    elif truths[x_var]>xhi:
-                        dx = truths[x_var]-xhi
-                        hist_2d_axes[(x_var,y_var)].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
-                    if truths[y_var]<ylo:
-                        dy = ylo - truths[y_var]
-                        hist_2d_axes[(x_var,y_var)].set_ylim((ylo-dy-0.05*(yhi-ylo),yhi))
-                    elif truths[y_var]>yhi:
-                        dy = truths[y_var] - yhi
-                        hist_2d_axes[(x_var,y_var)].set_ylim((ylo,yhi+dy+0.05*(yhi-ylo)))
-                    #TODO: deal with the pesky case of a prior edge
-                    hist_2d_axes[(x_var,y_var)].set_axis_bgcolor(scalarMap.to_rgba(0.)) #so that the contours blend
-                    hist_2d_axes[(x_var,y_var)].plot( truths[x_var], truths[y_var], '*',color = markercolor, markersize = markersize, markeredgecolor = 'none')
-            except KeyError:
-                pass
-        if x_var < n_traces - 1:
-            vals, walls = np.histogram( traces[x_var][:num_samples], bins=nbins, weights=weights, normed = True )
-
-            xplot = np.zeros( nbins*2 + 2 )
-            yplot = np.zeros( nbins*2 + 2 )
-            for i in range(1, nbins * 2 + 1 ):
-                xplot[i] = walls[int((i-1)/2)]
-                yplot[i] = vals[int((i-2)/2)]
-
-            xplot[0] = walls[0]
-            xplot[-1] = walls[-1]
-            yplot[0] = yplot[1]
-            yplot[-1] = yplot[-2]
-
-            if print_values is True:
-                hist_1d_axes[x_var].set_title("${0:.2f}^{{ +{1:.2f} }}_{{ -{2:.2f} }}$".format(res[x_var][0],res[x_var][1],res[x_var][2]),fontsize=fontsize)  
-            hist_1d_axes[x_var].plot(xplot, yplot, color = linecolor , lw=linewidth)
-            if filled: hist_1d_axes[x_var].fill_between(xplot,yplot,color=cVal)
-            hist_1d_axes[x_var].set_xlim( x_edges[0], x_edges[-1] )
-            if truths is not None:
-                xlo,xhi = hist_1d_axes[x_var].get_xlim()
-                if truths[x_var]<xlo:
-                    dx = xlo-truths[x_var]
-                    hist_1d_axes[x_var].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
-                elif truths[x_var]>xhi:
-                    dx = truths[x_var]-xhi
-                    hist_1d_axes[x_var].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
-                hist_1d_axes[x_var].axvline(truths[x_var],ls='--',c='k',lw=truthlinewidth)
+    if not scatter:
+        hists_2d = histograms_2d(traces, hist_2d_axes.keys(), nbins=nbins, weights=weights)
+    for (x_var,y_var), ax in hist_2d_axes.items():
+        if scatter:
+            #the scatter plots only need the extent of the samples, which the 1D bins span
+            H, x_edges, y_edges = None, hists_1d[x_var][1], hists_1d[y_var][1]
+        else:
+            H, x_edges, y_edges = hists_2d[(x_var,y_var)]
+        confidence_2d(traces[x_var],traces[y_var],weights=weights, ax=ax,nbins=nbins,intervals=None,linecolor=linecolor,filled=filled,cmap=cmap,linewidth=linewidth, gradient=gradient,scatter=scatter, scatter_color=scatter_color, scatter_alpha=scatter_alpha, scatter_size=scatter_size, H=H, xedges=x_edges, yedges=y_edges, fast_fill=fast_fill)
+        ax.set_xlim( x_edges[0], x_edges[-1] )
+        ax.set_ylim( y_edges[0], y_edges[-1] )
+        if truths is not None:
+            xlo,xhi = ax.get_xlim()
+            ylo,yhi = ax.get_ylim()
+            if truths[x_var]<xlo:
+                dx = xlo-truths[x_var]
+                ax.set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
+            elif truths[x_var]>xhi:
+                dx = truths[x_var]-xhi
+                ax.set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
+            if truths[y_var]<ylo:
+                dy = ylo - truths[y_var]
+                ax.set_ylim((ylo-dy-0.05*(yhi-ylo),yhi))
+            elif truths[y_var]>yhi:
+                dy = truths[y_var] - yhi
+                ax.set_ylim((ylo,yhi+dy+0.05*(yhi-ylo)))
+            #TODO: deal with the pesky case of a prior edge
+            ax.set_facecolor(bgVal) #so that the contours blend
+            ax.plot( truths[x_var], truths[y_var], **truth_marker)
 
     #Finally Add the Axis Labels
     for x_var in range(n_traces - 1):
@@ -331,7 +397,8 @@ def corner_plot( chain, weights=None, axis_labels=None,  print_values=True, fnam
     if fname != None:
         if len(fname.split('.')) == 1:
             fname += '.pdf'
-        plt.savefig(fname, transparent=True)
+        freeze_ticks(fig,major_formatter)
+        plt.savefig(fname, transparent=True, dpi=_savefig_dpi(fname))
 
     return None
 
@@ -398,7 +465,7 @@ def multi_corner_plot(chains, weights=None, axis_labels=None, chain_labels=None,
     if len(set([c.shape[1] for c in chains])) != 1:
         raise Exception("Each chain must have the same dimension.")
         
-    traces_list = [c.T for c in chains]
+    traces_list = [np.ascontiguousarray(np.transpose(c)) for c in chains]
 
     if axis_labels is None:
         axis_labels = ['']*len(traces_list[0])
@@ -441,14 +508,14 @@ def multi_corner_plot(chains, weights=None, axis_labels=None, chain_labels=None,
     hist_1d_axes[n_traces-1].yaxis.set_major_formatter(major_formatter)
 
     for_legend = [None]*len(chains)
+    #style of the truth markers, shared by every 2D panel
+    truth_marker = dict(marker='*', linestyle='none', color=truthcolor, markersize=markersize, markeredgecolor='none', zorder=100)
 
     #Remove the ticks from the axes which don't need them
     for x_var in range( n_traces -1 ):
         for y_var in range( 1, n_traces - 1):
-            try:
+            if (x_var,y_var) in hist_2d_axes:
                 hist_2d_axes[(x_var,y_var)].xaxis.set_visible(False)
-            except KeyError:
-                continue
     for var in range( n_traces - 1 ):
         hist_1d_axes[var].set_xticklabels([])
         hist_1d_axes[var].xaxis.set_major_locator(MaxNLocator(nticks))
@@ -456,27 +523,16 @@ def multi_corner_plot(chains, weights=None, axis_labels=None, chain_labels=None,
 
     for y_var in range( 1, n_traces ):
         for x_var in range( 1, n_traces - 1):
-            try:
+            if (x_var,y_var) in hist_2d_axes:
                 hist_2d_axes[(x_var,y_var)].yaxis.set_visible(False)
-            except KeyError:
-                continue
 
     for z,traces in enumerate(traces_list):
         #Do the plotting
         #Firstly make the 1D histograms
-        num_samples = min([ len(trace) for trace in traces])
-        vals, walls = np.histogram(traces[-1][:num_samples], bins=nbins[z], weights=weights[z], normed = True)
-
-        xplot = np.zeros( nbins[z]*2 + 2 )
-        yplot = np.zeros( nbins[z]*2 + 2 )
-        for i in range(1, nbins[z] * 2 + 1 ):
-            xplot[i] = walls[int((i-1)/2)]
-            yplot[i] = vals[int((i-2)/2)]
+        hists_1d = [ np.histogram(trace, bins=nbins[z], weights=weights[z], density=True) for trace in traces ]
+        vals, walls = hists_1d[-1]
 
-        xplot[0] = walls[0]
-        xplot[-1] = walls[-1]
-        yplot[0] = yplot[1]
-        yplot[-1] = yplot[-2]
+        xplot, yplot = histogram_steps(vals,walls)
 
         #this one's special, so do it on it's own 
         for_legend[z] = hist_1d_axes[n_traces - 1].plot(xplot, yplot, color = linecolors[z], lw=linewidth)
@@ -499,77 +555,67 @@ def multi_corner_plot(chains, weights=None, axis_labels=None, chain_labels=None,
 
 
         #Now Make the 2D histograms
-        for x_var in range( n_traces ):
-            for y_var in range( n_traces):
-                try:
-                    H, y_edges, x_edges = np.histogram2d( traces[y_var][:num_samples], traces[x_var][:num_samples],weights=weights[z], bins = nbins[z] )
-                    confidence_2d(traces[x_var][:num_samples],traces[y_var][:num_samples],weights=weights[z], ax=hist_2d_axes[(x_var,y_var)],nbins=nbins[z],intervals=None,linecolor=linecolors[z], filled=False,cmap="Blues",linewidth=linewidth, gradient=False,scatter=False,scatter_color='k', scatter_alpha=0., scatter_size=0.1)
-                    if z==0:
-                        hist_2d_axes[(x_var,y_var)].set_xlim( x_edges[0], x_edges[-1] )
-                        hist_2d_axes[(x_var,y_var)].set_ylim( y_edges[0], y_edges[-1] )
-                    xlo,xhi = hist_2d_axes[(x_var,y_var)].get_xlim()
-                    if x_edges[0]<xlo:
-                        xlo = x_edges[0]
-                    if x_edges[-1]>xhi:
-                        xhi = x_edges[-1]
-                    hist_2d_axes[(x_var,y_var)].set_xlim( xlo,xhi )
-                    ylo,yhi = hist_2d_axes[(x_var,y_var)].get_ylim()
-                    if y_edges[0]<ylo:
-                        ylo = y_edges[0]
-                    if y_edges[-1]>yhi:
-                        yhi = y_edges[-1]
-                    hist_2d_axes[(x_var,y_var)].set_ylim( ylo,yhi )                   
-                    if truths is not None:
-                        xlo,xhi = hist_2d_axes[(x_var,y_var)].get_xlim()
-                        ylo,yhi = hist_2d_axes[(x_var,y_var)].get_ylim()
-                        if truths[x_var]<xlo:
-                            dx = xlo-truths[x_var]
-                            hist_2d_axes[(x_var,y_var)].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
-                        elif truths[x_var]>xhi:
-                            dx = truths[x_var]-xhi
-                            hist_2d_axes[(x_var,y_var)].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
-                        if truths[y_var]<ylo:
-                            dy = ylo - truths[y_var]
-                            hist_2d_axes[(x_var,y_var)].set_ylim((ylo-dy-0.05*(yhi-ylo),yhi))
-                        elif truths[y_var]>yhi:
-                            dy = truths[y_var] - yhi
-                            hist_2d_axes[(x_var,y_var)].set_ylim((ylo,yhi+dy+0.05*(yhi-ylo)))
-                        if z==0:
-                            hist_2d_axes[(x_var,y_var)].plot( truths[x_var], truths[y_var], '*', color = truthcolor, markersize = markersize, markeredgecolor = 'none',zorder=100)
-                except KeyError:
-                    pass
-            if x_var < n_traces - 1:
-                vals, walls = np.histogram( traces[x_var][:num_samples], bins=nbins[z], weights=weights[z], normed = True )
-
-                xplot = np.zeros( nbins[z]*2 + 2 )
-                yplot = np.zeros( nbins[z]*2 + 2 )
-                for i in range(1, nbins[z] * 2 + 1 ):
-                    xplot[i] = walls[int((i-1)/2)]
-                    yplot[i] = vals[int((i-2)/2)]
-
-                xplot[0] = walls[0]
-                xplot[-1] = walls[-1]
-                yplot[0] = yplot[1]
-                yplot[-1] = yplot[-2]
+        hists_2d = histograms_2d(traces, hist_2d_axes.keys(), nbins=nbins[z], weights=weights[z])
+        for (x_var,y_var), ax in hist_2d_axes.items():
+            H, x_edges, y_edges = hists_2d[(x_var,y_var)]
+            confidence_2d(traces[x_var],traces[y_var],weights=weights[z], ax=ax,nbins=nbins[z],intervals=None,linecolor=linecolors[z], filled=False,cmap="Blues",linewidth=linewidth, gradient=False,scatter=False,scatter_color='k', scatter_alpha=0., scatter_size=0.1, H=H, xedges=x_edges, yedges=y_edges)
+            if z==0:
+                ax.set_xlim( x_edges[0], x_edges[-1] )
+                ax.set_ylim( y_edges[0], y_edges[-1] )
+            xlo,xhi = ax.get_xlim()
+            if x_edges[0]<xlo:
+                xlo = x_edges[0]
+            if x_edges[-1]>xhi:
+                xhi = x_edges[-1]
+            ax.set_xlim( xlo,xhi )
+            ylo,yhi = ax.get_ylim()
+            if y_edges[0]<ylo:
+                ylo = y_edges[0]
+            if y_edges[-1]>yhi:
+                yhi = y_edges[-1]
+            ax.set_ylim( ylo,yhi )                   
+            if truths is not None:
+                xlo,xhi = ax.get_xlim()
+                ylo,yhi = ax.get_ylim()
+                if truths[x_var]<xlo:
+                    dx = xlo-truths[x_var]
+                    ax.set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
+                elif truths[x_var]>xhi:
+                    dx = truths[x_var]-xhi
+                    ax.set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
+                if truths[y_var]<ylo:
+                    dy = ylo - truths[y_var]
+                    ax.set_ylim((ylo-dy-0.05*(yhi-ylo),yhi))
+                elif truths[y_var]>yhi:
+                    dy = truths[y_var] - yhi
+                    ax.set_ylim((ylo,yhi+dy+0.05*(yhi-ylo)))
+                if z==0:
+                    ax.plot( truths[x_var], truths[y_var], **truth_marker)
+
+        #and the rest of the 1D histograms
+        for x_var in range( n_traces - 1 ):
+            vals, walls = hists_1d[x_var]
+
+            xplot, yplot = histogram_steps(vals,walls)
  
-                hist_1d_axes[x_var].plot(xplot, yplot, color = linecolors[z] , lw=linewidth)
-                if z==0: hist_1d_axes[x_var].set_xlim( walls[0], walls[-1] )
+            hist_1d_axes[x_var].plot(xplot, yplot, color = linecolors[z] , lw=linewidth)
+            if z==0: hist_1d_axes[x_var].set_xlim( walls[0], walls[-1] )
+            xlo,xhi = hist_1d_axes[x_var].get_xlim()
+            if walls[0]<xlo:
+                xlo = walls[0]
+            if walls[-1]>xhi:
+                xhi = walls[-1]
+            hist_1d_axes[x_var].set_xlim( xlo, xhi )
+            if truths is not None:
                 xlo,xhi = hist_1d_axes[x_var].get_xlim()
-                if x_edges[0]<xlo:
-                    xlo = x_edges[0]
-                if x_edges[-1]>xhi:
-                    xhi = x_edges[-1]
-                hist_1d_axes[x_var].set_xlim( xlo, xhi )
-                if truths is not None:
-                    xlo,xhi = hist_1d_axes[x_var].get_xlim()
-                    if truths[x_var]<xlo:
-                        dx = xlo-truths[x_var]
-                        hist_1d_axes[x_var].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
-                    elif truths[x_var]>xhi:
-                        dx = truths[x_var]-xhi
-                        hist_1d_axes[x_var].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
-                    if z==0:
-                        hist_1d_axes[x_var].axvline(truths[x_var],ls='--',c=truthcolor,lw=truthlinewidth,zorder=100)
+                if truths[x_var]<xlo:
+                    dx = xlo-truths[x_var]
+                    hist_1d_axes[x_var].set_xlim((xlo-dx-0.05*(xhi-xlo),xhi))
+                elif truths[x_var]>xhi:
+                    dx = truths[x_var]-xhi
+                    hist_1d_axes[x_var].set_xlim((xlo,xhi+dx+0.05*(xhi-xlo)))
+                if z==0:
+                    hist_1d_axes[x_var].axvline(truths[x_var],ls='--',c=truthcolor,lw=truthlinewidth,zorder=100)
 
     #Finally Add the Axis Labels
     for x_var in range(n_traces - 1):
@@ -598,6 +644,7 @@ def multi_corner_plot(chains, weights=None, axis_labels=None, chain_labels=None,
     if fname != None:
         if len(fname.split('.')) == 1:
             fname += '.pdf'
-        plt.savefig(fname, transparent=True)
+        freeze_ticks(fig,major_formatter)
+        plt.savefig(fname, transparent=True, dpi=_savefig_dpi(fname))
 
     return None
\ No newline at end of file